@@ -12,6 +12,7 @@ Dependencies:
     - scipy
     - librosa
     - librosa.display
+    - threadpoolctl
     - os
 
 Usage:
@@ -20,131 +21,244 @@ Usage:
         python spectrogram.py
 """
 
+import functools
 import os
+from multiprocessing import Pool
 import numpy as np
 import librosa
 import librosa.display
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend: figures are only saved to disk.
 import matplotlib.pyplot as plt
+from scipy.fft import dct, irfft, next_fast_len, rfft
 from scipy.io import wavfile
-from scipy.signal import spectrogram
+from scipy.signal import get_window
+from threadpoolctl import threadpool_limits
+
+# Input and output folders.
+INPUT_FOLDER = 'output'
+SPECTROGRAM_FOLDER = 'spectrograms'
+WAVEFORM_FOLDER = 'waveforms'
+CEPSTRUM_FOLDER = 'cepstrums'
+MFCC_FOLDER = 'mfccs'
+
+# Number of threads pocketfft may use per transform (-1 uses all cores).
+# Pool workers lower this to 1 so files are parallelised across processes instead.
+FFT_WORKERS = -1
+
+# STFT settings for the spectrogram plots.
+SPEC_NPERSEG = 256
+SPEC_NOVERLAP = 32
+
+# STFT and mel settings used for the MFCCs (librosa.feature.mfcc defaults).
+MFCC_N_FFT = 2048
+MFCC_N_MELS = 128
 
 ### 🟢 HELPER FUNCTIONS
 
-def plot_and_save_waveform(signal, sampling_rate, title, output_filename):
+def to_mono_f32(signal):
+    """Converts a signal to mono float32, averaging channels in one pass without a float64 temporary."""
+    if signal.ndim == 1:
+        return signal.astype(np.float32, copy=False)
+    return np.mean(signal, axis=1, dtype=np.float32)
+
+def make_axes(with_colorbar=False):
+    """
+    Creates a persistent figure that the plot helpers clear and redraw for every file.
+    Returns (ax, cax); cax is a dedicated colorbar axes, or None.
+    Margins are fixed once here instead of running tight_layout on every save; the left
+    margin leaves room for 5-digit int16 tick labels, and the right one for the colorbar label.
+    """
+    if with_colorbar:
+        fig, (ax, cax) = plt.subplots(1, 2, figsize=(10, 4), gridspec_kw={'width_ratios': [40, 1]})
+        fig.subplots_adjust(left=0.1, right=0.91, bottom=0.13, top=0.9, wspace=0.05)
+    else:
+        fig, ax = plt.subplots(figsize=(10, 4))
+        cax = None
+        fig.subplots_adjust(left=0.1, right=0.97, bottom=0.13, top=0.9)
+    return ax, cax
+
+def plot_and_save_waveform(signal, sampling_rate, title, output_filename, ax):
     """Plots and saves a waveform."""
     time = np.linspace(0, len(signal) / sampling_rate, num=len(signal))
-    plt.figure(figsize=(10, 4))
-    plt.plot(time, signal, color='blue', linewidth=1)
-    plt.title(title)
-    plt.xlabel('Time [sec]')
-    plt.ylabel('Amplitude')
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(output_filename)
-    plt.close()
+    ax.cla()
+    ax.plot(time, signal, color='blue', linewidth=1)
+    ax.set_title(title)
+    ax.set_xlabel('Time [sec]')
+    ax.set_ylabel('Amplitude')
+    ax.grid(True)
+    ax.figure.savefig(output_filename)
     print(f"Saved waveform: {output_filename}")
 
-def plot_and_save_spectrogram(signal, sampling_rate, title, output_filename):
+@functools.lru_cache(maxsize=4)
+def _hann(n):
+    """Periodic Hann window of length n, built once and reused across files."""
+    return get_window('hann', n)
+
+def plot_and_save_spectrogram(signal, sampling_rate, title, output_filename, ax, cax):
     """Computes and saves a spectrogram."""
-    f, t, Sxx = spectrogram(signal, fs=sampling_rate)
+    # Frame the signal without copying, window it, and take a batched real FFT of all frames.
+    # Signals shorter than one frame use a single frame of their own length, as scipy's
+    # spectrogram does.
+    nperseg = min(SPEC_NPERSEG, len(signal))
+    noverlap = SPEC_NOVERLAP if nperseg == SPEC_NPERSEG else nperseg // 8
+    frames = np.lib.stride_tricks.sliding_window_view(signal, nperseg)[::nperseg - noverlap]
+    window = _hann(nperseg)
+    S = rfft(frames * window, axis=-1, workers=FFT_WORKERS)
+    # One-sided power spectral density, scaled as scipy's spectrogram does, so the dB
+    # range and the -100 dB floor of silent bins are unchanged.
+    Sxx = np.abs(S.T) ** 2  # shape (freq, time)
+    Sxx *= 1.0 / (sampling_rate * np.sum(window ** 2))
+    Sxx[1:-1 if nperseg % 2 == 0 else None] *= 2
     Sxx_dB = 10 * np.log10(Sxx + 1e-10)  # Convert to dB
-    plt.figure(figsize=(10, 4))
-    plt.pcolormesh(t, f, Sxx_dB, shading='gouraud', cmap='viridis')
-    plt.title(title)
-    plt.ylabel('Frequency [Hz]')
-    plt.xlabel('Time [sec]')
-    plt.colorbar(label='Intensity [dB]')
-    plt.tight_layout()
-    plt.savefig(output_filename)
-    plt.close()
+    duration = len(signal) / sampling_rate
+    ax.cla()
+    cax.cla()
+    mesh = ax.imshow(Sxx_dB, origin='lower', aspect='auto',
+                     extent=[0, duration, 0, sampling_rate / 2], cmap='viridis')
+    ax.set_title(title)
+    ax.set_ylabel('Frequency [Hz]')
+    ax.set_xlabel('Time [sec]')
+    ax.figure.colorbar(mesh, cax=cax, label='Intensity [dB]')
+    ax.figure.savefig(output_filename)
     print(f"Saved spectrogram: {output_filename}")
 
-def plot_and_save_cepstrum(signal, sampling_rate, title, output_filename, zoom_limit=0.005):
+@functools.lru_cache(maxsize=8)
+def _hamming(n):
+    """Hamming lifter window of length n, shared by files of the same length."""
+    return np.hamming(n)
+
+def _compute_cepstrum(signal, lifter):
+    """Real cepstrum of signal zero-padded to len(lifter), multiplied in place by the lifter window."""
+    N = len(lifter)
+    # The log-magnitude spectrum of a real signal is real and symmetric, so the
+    # half spectrum from rfft is enough and irfft returns the real cepstrum directly.
+    spectrum = rfft(signal, n=N, workers=FFT_WORKERS)
+    log_spectrum = np.abs(spectrum)
+    log_spectrum += 1e-10
+    np.log(log_spectrum, out=log_spectrum)
+    cepstrum = irfft(log_spectrum, n=N, workers=FFT_WORKERS)
+    cepstrum *= lifter
+    return cepstrum
+
+def plot_and_save_cepstrum(signal, sampling_rate, title, output_filename, ax, zoom_limit=0.005):
     """Computes and saves the cepstrum with liftering for better visualization."""
-    N = len(signal)
-    spectrum = np.fft.fft(signal)
-    log_spectrum = np.log(np.abs(spectrum) + 1e-10)
-    cepstrum = np.fft.ifft(log_spectrum).real
-    
+    # Zero-pad to a length with only small prime factors; the raw file length can be
+    # prime, which makes the FFT an order of magnitude slower.
+    N = next_fast_len(len(signal), real=True)
     # Apply a simple liftering (remove DC component and smooth)
-    lifter = np.hamming(len(cepstrum))
-    cepstrum *= lifter  # Liftering to remove low quefrency dominance
+    cepstrum = _compute_cepstrum(signal, _hamming(N))
 
     quefrency = np.arange(N) / sampling_rate
-    plt.figure(figsize=(10, 4))
-    plt.plot(quefrency, cepstrum, color='green')
-    plt.title(title)
-    plt.xlabel('Quefrency [s]')
-    plt.ylabel('Amplitude')
-    plt.grid(True)
-    plt.xlim(0, zoom_limit)  # Zoom into the first 5ms
-    plt.tight_layout()
-    plt.savefig(output_filename)
-    plt.close()
+    ax.cla()
+    ax.plot(quefrency, cepstrum, color='green')
+    ax.set_title(title)
+    ax.set_xlabel('Quefrency [s]')
+    ax.set_ylabel('Amplitude')
+    ax.grid(True)
+    ax.set_xlim(0, zoom_limit)  # Zoom into the first 5ms
+    ax.figure.savefig(output_filename)
     print(f"Saved cepstrum: {output_filename}")
 
-def plot_and_save_mfcc(signal, sampling_rate, title, output_filename, n_mfcc=13):
+@functools.lru_cache(maxsize=4)
+def _mfcc_basis(sampling_rate):
+    """Mel filter bank and Hann window for a sampling rate, built once and reused across files."""
+    mel_fb = librosa.filters.mel(sr=sampling_rate, n_fft=MFCC_N_FFT, n_mels=MFCC_N_MELS)
+    window = get_window('hann', MFCC_N_FFT)
+    return mel_fb, window
+
+def plot_and_save_mfcc(signal, sampling_rate, title, output_filename, ax, cax, n_mfcc=13):
     """Computes and saves the Mel-Frequency Cepstral Coefficients (MFCCs)."""
     
-    # Convert integer signal to float (Librosa requires float32)
-    signal = signal.astype(np.float32)  # Convert to float
-    signal /= np.max(np.abs(signal)) + 1e-10  # Normalize to [-1, 1] range
+    # Convert to float32 (Librosa requires float32) and normalize to [-1, 1] in place,
+    # multiplying by a precomputed reciprocal of the peak. The cast comes first so the
+    # peak of integer input (e.g. -32768 in int16) cannot overflow.
+    signal = np.array(signal, dtype=np.float32)
+    peak = max(signal.max(), -signal.min())
+    signal *= np.float32(1.0 / (peak + 1e-10))
 
-    mfccs = librosa.feature.mfcc(y=signal, sr=sampling_rate, n_mfcc=n_mfcc)
+    # Same pipeline as librosa.feature.mfcc, but with a cached filter bank and window.
+    mel_fb, window = _mfcc_basis(sampling_rate)
+    S = np.abs(librosa.stft(signal, n_fft=MFCC_N_FFT, window=window)) ** 2
+    log_mel = librosa.power_to_db(mel_fb @ S)
+    mfccs = dct(log_mel, type=2, axis=0, norm='ortho')[:n_mfcc]
     
-    plt.figure(figsize=(10, 4))
-    librosa.display.specshow(mfccs, sr=sampling_rate, x_axis='time', cmap='magma')
-    plt.title(title)
-    plt.colorbar(label='MFCC Coefficients')
-    plt.tight_layout()
-    plt.savefig(output_filename)
-    plt.close()
+    ax.cla()
+    cax.cla()
+    img = librosa.display.specshow(mfccs, sr=sampling_rate, x_axis='time', cmap='magma', ax=ax)
+    ax.set_title(title)
+    ax.figure.colorbar(img, cax=cax, label='MFCC Coefficients')
+    ax.figure.savefig(output_filename)
     print(f"Saved MFCC: {output_filename}")
 
 
+### 🟢 PER-FILE PROCESSING
+
+# Persistent figures of the current process, created by _init_worker.
+_AXES = None
+
+def _init_worker():
+    """Sets up a pool worker: single-threaded numerics and one persistent figure per plot type."""
+    global _AXES, FFT_WORKERS
+    threadpool_limits(1)
+    FFT_WORKERS = 1
+    _AXES = {
+        'wave': make_axes(),
+        'spec': make_axes(with_colorbar=True),
+        'cepstrum': make_axes(),
+        'mfcc': make_axes(with_colorbar=True),
+    }
+
+def _process_one(filename):
+    """Generates the waveform, spectrogram, cepstrum and MFCC plots for one WAV file."""
+    file_path = os.path.join(INPUT_FOLDER, filename)
+    sampling_rate, signal = wavfile.read(file_path)
+
+    signal = to_mono_f32(signal)  # Convert to mono if stereo
+    
+    base_filename = os.path.splitext(filename)[0]
+    wave_ax, _ = _AXES['wave']
+    spec_ax, spec_cax = _AXES['spec']
+    cepstrum_ax, _ = _AXES['cepstrum']
+    mfcc_ax, mfcc_cax = _AXES['mfcc']
+    
+    # Waveform
+    wave_title = f"Waveform of {filename}"
+    wave_output = os.path.join(WAVEFORM_FOLDER, f"{base_filename}-waveform.png")
+    plot_and_save_waveform(signal, sampling_rate, wave_title, wave_output, wave_ax)
+
+    # Spectrogram
+    spec_title = f"Spectrogram of {filename}"
+    spec_output = os.path.join(SPECTROGRAM_FOLDER, f"{base_filename}-spectrogram.png")
+    plot_and_save_spectrogram(signal, sampling_rate, spec_title, spec_output, spec_ax, spec_cax)
+
+    # Cepstrum
+    cepstrum_title = f"Cepstrum of {filename}"
+    cepstrum_output = os.path.join(CEPSTRUM_FOLDER, f"{base_filename}-cepstrum.png")
+    plot_and_save_cepstrum(signal, sampling_rate, cepstrum_title, cepstrum_output, cepstrum_ax)
+
+    # MFCC
+    mfcc_title = f"MFCCs of {filename}"
+    mfcc_output = os.path.join(MFCC_FOLDER, f"{base_filename}-mfcc.png")
+    plot_and_save_mfcc(signal, sampling_rate, mfcc_title, mfcc_output, mfcc_ax, mfcc_cax)
+    return filename
+
+
 ### 🟢 MAIN FUNCTION
 
 def main():
-    input_folder = 'output'
-    spectrogram_folder = 'spectrograms'
-    waveform_folder = 'waveforms'
-    cepstrum_folder = 'cepstrums'
-    mfcc_folder = 'mfccs'
-
-    os.makedirs(spectrogram_folder, exist_ok=True)
-    os.makedirs(waveform_folder, exist_ok=True)
-    os.makedirs(cepstrum_folder, exist_ok=True)
-    os.makedirs(mfcc_folder, exist_ok=True)
-
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith('.wav'):
-            file_path = os.path.join(input_folder, filename)
-            sampling_rate, signal = wavfile.read(file_path)
-
-            if signal.ndim > 1:
-                signal = np.mean(signal, axis=1)  # Convert to mono if stereo
-            
-            base_filename = os.path.splitext(filename)[0]
-            
-            # Waveform
-            wave_title = f"Waveform of {filename}"
-            wave_output = os.path.join(waveform_folder, f"{base_filename}-waveform.png")
-            plot_and_save_waveform(signal, sampling_rate, wave_title, wave_output)
-
-            # Spectrogram
-            spec_title = f"Spectrogram of {filename}"
-            spec_output = os.path.join(spectrogram_folder, f"{base_filename}-spectrogram.png")
-            plot_and_save_spectrogram(signal, sampling_rate, spec_title, spec_output)
-
-            # Cepstrum
-            cepstrum_title = f"Cepstrum of {filename}"
-            cepstrum_output = os.path.join(cepstrum_folder, f"{base_filename}-cepstrum.png")
-            plot_and_save_cepstrum(signal, sampling_rate, cepstrum_title, cepstrum_output)
-
-            # MFCC
-            mfcc_title = f"MFCCs of {filename}"
-            mfcc_output = os.path.join(mfcc_folder, f"{base_filename}-mfcc.png")
-            plot_and_save_mfcc(signal, sampling_rate, mfcc_title, mfcc_output)
+    os.makedirs(SPECTROGRAM_FOLDER, exist_ok=True)
+    os.makedirs(WAVEFORM_FOLDER, exist_ok=True)
+    os.makedirs(CEPSTRUM_FOLDER, exist_ok=True)
+    os.makedirs(MFCC_FOLDER, exist_ok=True)
+
+    wav_files = [filename for filename in os.listdir(INPUT_FOLDER) if filename.lower().endswith('.wav')]
+
+    # Files are independent, so analyse them in parallel, one process per core
+    # (but no more processes than files).
+    processes = max(1, min(os.cpu_count(), len(wav_files)))
+    with Pool(processes=processes, initializer=_init_worker) as pool:
+        list(pool.imap_unordered(_process_one, wav_files))
 
 if __name__ == "__main__":
     main()
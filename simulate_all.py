@@ -11,15 +11,97 @@ Usage:
 """
 
 import glob
-import json
 import os
 import sys
-from simulate_audio import simulate_room, apply_microphone_model, write_output
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import orjson
+from threadpoolctl import threadpool_limits
+import simulate_audio
+from simulate_audio import load_audio, simulate_room, apply_microphone_model, write_output
+
+# Shared memory blocks attached by the current worker process, keyed by name.
+_ATTACHED = {}
 
 def extract_filename(filepath):
     """Extracts the base filename without extension from a given path."""
     return os.path.splitext(os.path.basename(filepath))[0]
 
+def _init_worker():
+    """
+    Limit FFT threading (using FFTW when pyfftw is installed) and reseed the noise
+    generator in each worker process.
+    """
+    # Nearly all of a simulation (RIR generation and the source convolutions) is
+    # single-threaded, so the pool runs one process per core with one FFT thread each.
+    simulate_audio.FFT_WORKERS = 1
+    simulate_audio.use_fftw()
+    simulate_audio.reseed_noise()
+
+def load_configs(config_files):
+    """Parse all JSON configuration files up front. Returns a list of (cfg_file, config) pairs."""
+    configs = []
+    for cfg_file in config_files:
+        with open(cfg_file, "rb") as f:
+            configs.append((cfg_file, orjson.loads(f.read())))
+    return configs
+
+def config_sampling_rate(config):
+    """Sampling rate a configuration is simulated at (as used by simulate_room)."""
+    return config.get("microphone_model", {}).get("sampling_rate", 16000)
+
+def share_signal(signal):
+    """
+    Copy a float32 signal into a new shared memory block.
+    Returns (shm, (name, shape)); the handle is passed to workers, which read it with
+    _attach_signal. The caller must close and unlink shm when the workers are done.
+    """
+    shm = SharedMemory(create=True, size=max(signal.nbytes, 1))
+    np.ndarray(signal.shape, dtype=np.float32, buffer=shm.buf)[:] = signal
+    return shm, (shm.name, signal.shape)
+
+def _attach_signal(handle):
+    """Read-only view of a signal shared by share_signal, without copying it."""
+    name, shape = handle
+    if name not in _ATTACHED:
+        _ATTACHED[name] = SharedMemory(name=name)
+    signal = np.ndarray(shape, dtype=np.float32, buffer=_ATTACHED[name].buf)
+    signal.flags.writeable = False
+    return signal
+
+def _run_one(cfg_file, config, speech_file_path, speech_handle):
+    """
+    Simulate a single parsed configuration in a worker process, using the speech
+    signal shared by the parent process.
+    Returns (signals, fs, output_filename); the parent process writes the output file.
+    """
+    # Keep each worker to a single BLAS thread so the pool does not oversubscribe the cores.
+    with threadpool_limits(1):
+        # Extract the config and speech file names (e.g., "config1" and "speech1").
+        config_name = extract_filename(cfg_file)
+        speech_name = extract_filename(speech_file_path)
+
+        print(f"Simulating scenario with {config_name} and {speech_name}...")
+
+        # Override the speech file in the configuration.
+        config.setdefault("sources", {}).setdefault("speech", {})["signal_file"] = speech_file_path
+
+        # Run the simulation.
+        signals, room = simulate_room(config, speech_signal=_attach_signal(speech_handle))
+
+        # Apply microphone model if defined.
+        mic_model_cfg = config.get("microphone_model")
+        if mic_model_cfg:
+            # The simulated signals are not used elsewhere, so the model may work in place.
+            signals = apply_microphone_model(signals, mic_model_cfg, overwrite_input=True)
+
+        # Create output filename: <speechName>-<configName>-out.wav.
+        output_filename = os.path.join("output", f"{speech_name}-{config_name}-out.wav")
+        # Use room.fs if available; if room is None (precomputed IR mode), use the sampling rate from mic_model.
+        fs = room.fs if room is not None else config_sampling_rate(config)
+    return signals, fs, output_filename
+
 def main():
     # Ensure a speech file argument is provided.
     if len(sys.argv) < 2:
@@ -33,41 +115,48 @@ def main():
         print(f"Error: Speech file '{speech_file_path}' not found.")
         sys.exit(1)
 
-    # Extract the speech file name (e.g., "speech1" from "samples/speech1.wav").
-    speech_name = extract_filename(speech_file_path)
-
     # Get all configuration files.
     config_files = sorted(glob.glob("config/config*.json"))
     if not config_files:
         print("No configuration files found in the config/ folder.")
         return
 
-    for cfg_file in config_files:
-        with open(cfg_file, "r") as f:
-            config = json.load(f)
-
-        # Extract the config file name (e.g., "config1" from "config1.json").
-        config_name = extract_filename(cfg_file)
-
-        print(f"Simulating scenario with {config_name} and {speech_name}...")
-
-        # Override the speech file in the configuration.
-        config.setdefault("sources", {}).setdefault("speech", {})["signal_file"] = speech_file_path
-
-        # Run the simulation.
-        signals, room = simulate_room(config)
-
-        # Apply microphone model if defined.
-        mic_model_cfg = config.get("microphone_model")
-        if mic_model_cfg:
-            signals = apply_microphone_model(signals, mic_model_cfg)
-
-        # Create output filename: <speechName>-<configName>-out.wav.
-        output_filename = os.path.join("output", f"{speech_name}-{config_name}-out.wav")
-        # Use room.fs if available; if room is None (precomputed IR mode), use the sampling rate from mic_model.
-        fs = room.fs if room is not None else config.get("microphone_model", {}).get("sampling_rate", 16000)
-        write_output(signals, fs, output_filename)
-        print(f"Simulation complete: {output_filename}\n")
+    configs = load_configs(config_files)
+
+    # Decode and resample the speech once per sampling rate and share it with the
+    # workers, instead of every worker loading the same file.
+    shared = {}
+    try:
+        for _, config in configs:
+            fs = config_sampling_rate(config)
+            if fs not in shared:
+                _, speech = load_audio(speech_file_path, target_fs=fs)
+                shared[fs] = share_signal(speech)
+
+        # Output files are written by background threads while the remaining scenarios
+        # are simulated; a failed write raises here like a failed simulation.
+        max_workers = min(os.cpu_count(), len(configs))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as ex, \
+                ThreadPoolExecutor(max_workers=2) as write_pool:
+            pending = {ex.submit(_run_one, cfg_file, config, speech_file_path,
+                                 shared[config_sampling_rate(config)][1])
+                       for cfg_file, config in configs}
+            writes = {}  # Write future -> output filename.
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in writes:
+                        future.result()
+                        print(f"Simulation complete: {writes[future]}\n")
+                    else:
+                        signals, fs, output_filename = future.result()
+                        write = write_pool.submit(write_output, signals, fs, output_filename)
+                        writes[write] = output_filename
+                        pending.add(write)
+    finally:
+        for shm, _ in shared.values():
+            shm.close()
+            shm.unlink()
 
 if __name__ == "__main__":
     main()
@@ -8,32 +8,298 @@ adds sources (speech and noise), and applies a microphone model (FIR filtering a
 For music noise sources, if the music signal is longer than the speech signal, it will be clipped to the speech signal length.
 """
 
+import functools
+import hashlib
+import json
+import math
+import os
+import tempfile
+import zipfile
+
 import numpy as np
 import pyroomacoustics as pra
+import scipy.fft
+from scipy.fft import rfft, irfft, next_fast_len
 from scipy.io import wavfile
-from scipy.signal import fftconvolve, resample
+from scipy.signal import fftconvolve, resample, resample_poly
 
-def load_audio(filepath, target_fs=None):
+try:
+    import soxr
+except ImportError:  # soxr is optional; scipy's polyphase resampler is used instead.
+    soxr = None
+
+try:
+    import soundfile
+except ImportError:  # soundfile is optional; only needed for non-WAV inputs such as FLAC/OGG.
+    soundfile = None
+
+try:
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+except ImportError:  # pyfftw is optional; scipy's pocketfft is used instead.
+    pyfftw = None
+
+# Smallest FFT block used by the overlap-save convolution, so short FIR filters
+# are not processed in thousands of tiny blocks.
+MIN_BLOCK_SIZE = 4096
+
+# Number of threads pocketfft may use per transform (-1 uses all cores).
+# Batch drivers running several simulations in parallel should lower this to
+# avoid oversubscribing the CPU.
+FFT_WORKERS = -1
+
+# Directory where room impulse responses are cached between runs, keyed on the room
+# geometry. Set to None to always recompute them.
+RIR_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".rir_cache")
+
+def use_fftw():
     """
-    Load an audio file as a mono normalized float32 signal.
-    Optionally, resample it to target_fs.
-    Assumes a WAV file with a RIFF header.
+    Route scipy.fft, and so the overlap-save convolution and pyroomacoustics' fftconvolve,
+    through FFTW for the rest of the process. Returns False if pyfftw is not installed.
+    """
+    if pyfftw is None:
+        return False
+    pyfftw.interfaces.cache.enable()  # Keep the FFTW plans between calls.
+    scipy.fft.set_global_backend(pyfftw.interfaces.scipy_fft)
+    return True
+
+# Random generator used for Gaussian noise sources.
+_RNG = np.random.default_rng()
+
+def reseed_noise(seed=None):
+    """
+    Replace the Gaussian noise generator with a freshly seeded one.
+    Worker processes forked from a common parent should call this so their noise differs.
+    """
+    global _RNG
+    _RNG = np.random.default_rng(seed)
+
+def _read_audio(filepath):
     """
-    fs, data = wavfile.read(filepath)
+    Read an audio file as (fs, data).
+    PCM WAV files are memory-mapped so only the samples actually used are read from disk.
+    WAV files that cannot be mapped (e.g. 24-bit PCM) are read in full, and other
+    formats (FLAC, OGG, ...) are read with soundfile when it is installed.
+    """
+    try:
+        return wavfile.read(filepath, mmap=True)
+    except ValueError:
+        pass
+    try:
+        return wavfile.read(filepath)
+    except ValueError:
+        if soundfile is None:
+            raise
+    data, fs = soundfile.read(filepath, dtype="float32")
+    return fs, data
+
+def _resample(data, fs, target_fs):
+    """
+    Resample a mono signal from fs to target_fs as float32, keeping the length at
+    int(len(data) * target_fs / fs). Uses soxr when installed, otherwise a polyphase
+    FIR for integer rates and the FFT resampler for anything else.
+    """
+    num_samples = int(len(data) * target_fs / fs)
+    if soxr is not None:
+        data = soxr.resample(np.ascontiguousarray(data, dtype=np.float32), fs, target_fs, quality='HQ')
+    elif float(target_fs).is_integer():
+        # Polyphase FIR resampling for integer rates (e.g. 44100 -> 16000 is 160/441).
+        g = math.gcd(fs, int(target_fs))
+        up = int(target_fs) // g
+        down = fs // g
+        data = resample_poly(data, up, down)
+    else:
+        data = resample(data, num_samples)
+    return data[:num_samples].astype(np.float32, copy=False)
+
+@functools.lru_cache(maxsize=32)
+def _load_audio_cached(filepath, target_fs, mtime):
+    """
+    Read, normalize and resample an audio file. Memoized per (filepath, target_fs, mtime),
+    so an edited file is re-read; results are returned read-only.
+    """
+    # A mono float WAV at the target rate is returned as the memory-mapped view itself.
+    fs, data = _read_audio(filepath)
     if data.ndim > 1:
-        data = data[:, 0]  # use first channel if stereo
+        data = np.ascontiguousarray(data[:, 0])  # use first channel if stereo
     if np.issubdtype(data.dtype, np.integer):
-        max_val = np.iinfo(data.dtype).max
-        data = data.astype(np.float32) / max_val
+        # Cast and scale in a single pass instead of astype followed by a divide.
+        scale = np.float32(1.0 / np.iinfo(data.dtype).max)
+        data = np.multiply(data, scale, dtype=np.float32)
     if target_fs is not None and fs != target_fs:
-        num_samples = int(len(data) * target_fs / fs)
-        data = resample(data, num_samples)
+        data = _resample(data, fs, target_fs)
         fs = target_fs
+    data = data.astype(np.float32, copy=False)  # e.g. float64 WAV files
+    data.flags.writeable = False
     return fs, data
 
-def simulate_room(config):
+def load_audio(filepath, target_fs=None):
+    """
+    Load an audio file as a mono normalized float32 signal.
+    Optionally, resample it to target_fs.
+    WAV files are expected; other formats need the optional soundfile package.
+    Repeated loads of the same (filepath, target_fs) are served from a cache, so the
+    signal is returned read-only; copy it before modifying it in place.
+    """
+    return _load_audio_cached(filepath, target_fs, os.path.getmtime(filepath))
+
+@functools.lru_cache(maxsize=16)
+def _load_frequency_response_cached(freq_resp_file, mtime):
+    """
+    Parse a microphone frequency response file (whitespace-separated FIR taps, one per
+    line). Memoized per (freq_resp_file, mtime), so an edited file is re-read; results
+    are returned read-only.
+    """
+    with open(freq_resp_file) as f:
+        text = f.read()
+    if "#" in text:
+        # Drop '#' comments, which np.loadtxt used to skip.
+        text = "\n".join(line.split("#", 1)[0] for line in text.splitlines())
+    # np.fromstring with a whitespace separator parses in C, unlike the pure-Python np.loadtxt.
+    freq_resp = np.fromstring(text, sep=" ", dtype=np.float32)
+    freq_resp.flags.writeable = False
+    return freq_resp
+
+def ir_spectrum(ir):
+    """
+    Compute the overlap-save block size and the real FFT of the impulse response.
+    The returned (block_size, H) pair can be reused for every signal convolved with ir.
+    H is single precision, matching the float32 signals it is applied to.
+    """
+    block_size = next_fast_len(max(8 * len(ir), MIN_BLOCK_SIZE))
+    H = rfft(ir, n=block_size, workers=FFT_WORKERS).astype(np.complex64)
+    return block_size, H
+
+@functools.lru_cache(maxsize=16)
+def _frequency_response_spectrum(freq_resp_file, mtime):
+    """Overlap-save spectrum of a microphone frequency response, computed once per file version."""
+    return ir_spectrum(_load_frequency_response_cached(freq_resp_file, mtime))
+
+def overlap_save_convolve(x, ir, spectrum=None):
+    """
+    Full linear convolution of the real signal x with ir along its last axis, using
+    overlap-save and real FFTs. Equivalent to fftconvolve(x, ir, mode="full") for 1D x,
+    applied row by row for 2D x. Pass a precomputed ir_spectrum(ir) as spectrum to
+    avoid recomputing the IR FFT.
+    """
+    if spectrum is None:
+        spectrum = ir_spectrum(ir)
+    block_size, H = spectrum
+    ir_len = len(ir)
+    step = block_size - ir_len + 1
+    n_samples = x.shape[-1]
+    out_len = n_samples + ir_len - 1
+    n_blocks = -(-out_len // step)
+    # Prepend ir_len - 1 zeros so the first block has a full history, and pad the end
+    # so that every block is complete.
+    padded = np.zeros(x.shape[:-1] + ((n_blocks - 1) * step + block_size,), dtype=x.dtype)
+    padded[..., ir_len - 1:ir_len - 1 + n_samples] = x
+    # The blocks are strided views of padded, transformed together in one batched call.
+    blocks = np.lib.stride_tricks.sliding_window_view(padded, block_size, axis=-1)[..., ::step, :]
+    spectra = rfft(blocks, axis=-1, workers=FFT_WORKERS)
+    spectra *= H
+    y = irfft(spectra, n=block_size, axis=-1, workers=FFT_WORKERS)[..., ir_len - 1:]
+    return y.reshape(x.shape[:-1] + (n_blocks * step,))[..., :out_len]
+
+def _batched_same_convolve(signals, fir, spectrum=None):
+    """
+    Convolve every row of the 2D array signals with fir in a single batched call.
+    Equivalent to fftconvolve(row, fir, mode='same') applied to each row.
+    spectrum is an optional precomputed ir_spectrum(fir).
+    """
+    full = overlap_save_convolve(signals, fir, spectrum)
+    # Keep the centre of the full convolution, as with mode='same'.
+    start = (len(fir) - 1) // 2
+    return full[:, start:start + signals.shape[1]]
+
+def mix_room_sources(room):
+    """
+    Convolve every source of a pyroomacoustics room with its RIRs and sum them per
+    microphone, recording the result on the mic array. Gives the same signals as
+    room.simulate() (in float32), but accumulates directly into one
+    (n_mics, n_samples) buffer instead of first building an
+    (n_sources, n_mics, n_samples) premix array.
+    """
+    if room.rir is None or len(room.rir) == 0:
+        room.compute_rir()
+    delays = [int(np.floor(source.delay * room.fs)) for source in room.sources]
+    max_len_rir = max(len(h) for mic_rirs in room.rir for h in mic_rirs)
+    max_sig_len = max(len(source.signal) + d for source, d in zip(room.sources, delays))
+    n_samples = max_len_rir + max_sig_len - 1
+    if n_samples % 2 == 1:
+        n_samples += 1  # Same (even) length as room.simulate().
+    # The RIRs are cast to float32 so the convolutions and the mix run in single precision.
+    signals = np.zeros((room.mic_array.M, n_samples), dtype=np.float32)
+    for m, mic_rirs in enumerate(room.rir):
+        for source, d, h in zip(room.sources, delays, mic_rirs):
+            sig = source.signal
+            signals[m, d:d + len(sig) + len(h) - 1] += fftconvolve(h.astype(np.float32), sig)
+    room.mic_array.record(signals, room.fs)
+    return signals
+
+def _rir_cache_key(dimensions, rt60, fs, mic_positions, source_positions):
+    """
+    Hash of everything the RIRs of a generated room depend on. The source signals and
+    delays are not part of it: they are only applied when the sources are mixed.
+    """
+    state = {
+        "dims": dimensions,
+        "rt60": rt60,
+        "fs": fs,
+        "mics": mic_positions,
+        "src_pos": source_positions,
+        "pra": pra.__version__,
+    }
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+def compute_rir_cached(room, key):
+    """
+    Set room.rir from the on-disk cache entry for key, computing and storing it on a miss.
+    RIRs are stored in an .npz file as one array per (microphone, source) pair. The cache
+    is best effort: if the entry cannot be written, the computed RIRs are still returned.
+    """
+    if RIR_CACHE_DIR is None:
+        room.compute_rir()
+        return room.rir
+    cache_file = os.path.join(RIR_CACHE_DIR, key + ".npz")
+    n_mics, n_sources = room.mic_array.M, len(room.sources)
+    try:
+        with np.load(cache_file) as cached:
+            room.rir = [[cached[f"m{m}_s{s}"] for s in range(n_sources)] for m in range(n_mics)]
+        return room.rir
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        pass  # Not cached yet (or an unreadable entry): compute it below.
+    room.compute_rir()
+    tmp_file = None
+    try:
+        os.makedirs(RIR_CACHE_DIR, exist_ok=True)
+        # Write to a temporary file first so parallel workers never read a partial entry.
+        fd, tmp_file = tempfile.mkstemp(dir=RIR_CACHE_DIR, suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **{f"m{m}_s{s}": h for m, mic_rirs in enumerate(room.rir)
+                           for s, h in enumerate(mic_rirs)})
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Could not cache RIRs in {RIR_CACHE_DIR}: {e}")
+        if tmp_file is not None and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return room.rir
+
+@functools.lru_cache(maxsize=64)
+def _room_material(rt60, dimensions):
+    """
+    Wall material and image-source order giving rt60 in a shoebox room of the given
+    dimensions (a tuple). Memoized, since many configurations share the same room.
+    The flat (single-band) material is never modified by pyroomacoustics, so it can be shared.
+    """
+    e_absorption, max_order = pra.inverse_sabine(rt60, list(dimensions))
+    return pra.Material(e_absorption), max_order
+
+def simulate_room(config, speech_signal=None):
     """
     Set up and simulate the room based on the JSON configuration.
+    If speech_signal is given, it is used as the speech source (already at the
+    simulation sampling rate) instead of loading the speech "signal_file".
     Returns:
       - signals: numpy array with the final simulated (or convolved) signal.
       - room: the pyroomacoustics Room object (or None in precomputed IR mode).
@@ -60,21 +326,35 @@ def simulate_room(config):
         if speech_cfg is None:
             raise ValueError("A speech source must be specified.")
         speech_file = speech_cfg.get("signal_file")
-        if speech_file is None:
-            raise ValueError("Speech source must include 'signal_file'.")
-        fs_speech, speech_signal = load_audio(speech_file, target_fs=fs)
+        if speech_signal is None:
+            if speech_file is None:
+                raise ValueError("Speech source must include 'signal_file'.")
+            fs_speech, speech_signal = load_audio(speech_file, target_fs=fs)
         delay = speech_cfg.get("delay", 0.0)
         # Apply delay by padding the beginning with zeros if needed.
         delay_samples = int(delay * fs)
         if delay_samples > 0:
-            speech_signal = np.concatenate((np.zeros(delay_samples), speech_signal))
-        # Convolve the speech with the IR.
-        convolved_signal = fftconvolve(speech_signal, ir_signal, mode="full")
+            speech_signal = np.concatenate((np.zeros(delay_samples, dtype=np.float32), speech_signal))
+        # Convolve the speech with the IR; the IR spectrum is shared with the noise sources.
+        ir_spec = ir_spectrum(ir_signal)
+        convolved_signal = overlap_save_convolve(speech_signal, ir_signal, ir_spec)
         
         # Process any noise sources similarly.
         noise_sources = sources_cfg.get("noise", [])
-        for noise in noise_sources:
-            noise_type = noise.get("type", "").lower()
+        noise_types = [noise.get("type", "").lower() for noise in noise_sources]
+        speech_length = len(speech_signal)
+        # Independent Gaussian sources convolved with the same IR are equivalent to a
+        # single Gaussian source with the root-sum-square amplitude, so generate and
+        # convolve one buffer for all of them.
+        gaussian_amplitudes = [noise.get("amplitude", 1.0)
+                               for noise, noise_type in zip(noise_sources, noise_types)
+                               if noise_type == "gaussian"]
+        if gaussian_amplitudes:
+            amplitude = math.sqrt(sum(a * a for a in gaussian_amplitudes))
+            noise_signal = amplitude * _RNG.standard_normal(speech_length, dtype=np.float32)
+            noise_convolved = overlap_save_convolve(noise_signal, ir_signal, ir_spec)
+            convolved_signal += noise_convolved
+        for noise, noise_type in zip(noise_sources, noise_types):
             amplitude = noise.get("amplitude", 1.0)
             if noise_type == "music":
                 noise_file = noise.get("signal_file")
@@ -82,15 +362,13 @@ def simulate_room(config):
                     raise ValueError("Music noise source must include a 'signal_file'.")
                 fs_noise, noise_signal = load_audio(noise_file, target_fs=fs)
                 # Clip noise to speech length if longer.
-                if len(noise_signal) > len(speech_signal):
-                    noise_signal = noise_signal[:len(speech_signal)]
+                if len(noise_signal) > speech_length:
+                    noise_signal = noise_signal[:speech_length]
                 noise_signal = amplitude * noise_signal
-                noise_convolved = fftconvolve(noise_signal, ir_signal, mode="full")
+                noise_convolved = overlap_save_convolve(noise_signal, ir_signal, ir_spec)
                 convolved_signal += noise_convolved
             elif noise_type == "gaussian":
-                noise_signal = amplitude * np.random.randn(len(speech_signal))
-                noise_convolved = fftconvolve(noise_signal, ir_signal, mode="full")
-                convolved_signal += noise_convolved
+                continue  # Already added as part of the combined Gaussian source.
             else:
                 raise ValueError(f"Unknown noise source type: {noise_type}")
         return convolved_signal, None
@@ -104,8 +382,7 @@ def simulate_room(config):
         if rt60 is None:
             raise ValueError("rt60 must be provided in the configuration when no IR file is specified.")
 
-        e_absorption, max_order = pra.inverse_sabine(rt60, dimensions)
-        materials = pra.Material(e_absorption)
+        materials, max_order = _room_material(rt60, tuple(dimensions))
         room = pra.ShoeBox(dimensions, fs=fs, materials=materials, max_order=max_order)
 
         # Add microphone array.
@@ -122,18 +399,25 @@ def simulate_room(config):
             raise ValueError("A speech source must be specified.")
         speech_pos = speech_cfg.get("position")
         speech_file = speech_cfg.get("signal_file")
-        if speech_pos is None or speech_file is None:
+        if speech_pos is None or (speech_file is None and speech_signal is None):
             raise ValueError("Speech source must include 'position' and 'signal_file'.")
-        fs_speech, speech_signal = load_audio(speech_file, target_fs=fs)
+        if speech_signal is None:
+            fs_speech, speech_signal = load_audio(speech_file, target_fs=fs)
         speech_length = len(speech_signal)
         delay = speech_cfg.get("delay", 0.0)
-        room.add_source(speech_pos, signal=speech_signal, delay=delay)
+        # Source signals are handed over as contiguous float32 so the mix stays single precision.
+        room.add_source(speech_pos, signal=np.ascontiguousarray(speech_signal, dtype=np.float32), delay=delay)
 
         # Add noise sources.
         noise_sources = sources_cfg.get("noise", [])
-        for noise in noise_sources:
-            noise_type = noise.get("type", "").lower()
+        # Draw all Gaussian sources as one contiguous float32 block, one row per source.
+        noise_types = [noise.get("type", "").lower() for noise in noise_sources]
+        n_gaussian = noise_types.count("gaussian")
+        gaussian_rows = iter(_RNG.standard_normal((n_gaussian, speech_length), dtype=np.float32))
+        noise_positions = []
+        for noise, noise_type in zip(noise_sources, noise_types):
             noise_pos = noise.get("position")
+            noise_positions.append(noise_pos)
             amplitude = noise.get("amplitude", 1.0)
             if noise_pos is None or noise_type == "":
                 raise ValueError("Each noise source must have a 'type' and 'position'.")
@@ -145,41 +429,58 @@ def simulate_room(config):
                 if len(noise_signal) > speech_length:
                     noise_signal = noise_signal[:speech_length]
                 noise_signal = amplitude * noise_signal
-                room.add_source(noise_pos, signal=noise_signal, delay=0.0)
+                room.add_source(noise_pos, signal=np.ascontiguousarray(noise_signal, dtype=np.float32), delay=0.0)
             elif noise_type == "gaussian":
-                noise_signal = amplitude * np.random.randn(speech_length)
+                noise_signal = next(gaussian_rows)
+                noise_signal *= np.float32(amplitude)
                 room.add_source(noise_pos, signal=noise_signal, delay=0.0)
             else:
                 raise ValueError(f"Unknown noise source type: {noise_type}")
 
-        premix = room.simulate(return_premix=True)
-        mixed_signals = np.sum(premix, axis=0)
+        # The RIRs only depend on the room geometry, so they are reused across simulations.
+        rir_key = _rir_cache_key(dimensions, rt60, fs, mic_positions, [speech_pos] + noise_positions)
+        compute_rir_cached(room, rir_key)
+        mixed_signals = mix_room_sources(room)
         return mixed_signals, room
 
-def apply_microphone_model(signals, mic_model_cfg):
+def apply_microphone_model(signals, mic_model_cfg, overwrite_input=False):
     """
     Apply the microphone model to the simulated signals.
     Convolve each channel with the frequency response if provided,
     then add a white noise floor.
+    The input is not modified unless overwrite_input is True, in which case the noise
+    floor may be added to it in place to save a full-size allocation. It is returned
+    as is when the model has neither.
     """
-    processed = signals.copy()
     fs = mic_model_cfg.get("sampling_rate")
     noise_floor_db = mic_model_cfg.get("noise_floor")
     freq_resp_file = mic_model_cfg.get("frequency_response")
 
     if freq_resp_file is not None:
-        freq_resp = np.loadtxt(freq_resp_file)
+        mtime = os.path.getmtime(freq_resp_file)
+        freq_resp = _load_frequency_response_cached(freq_resp_file, mtime)
         # If the signal is 1D (from precomputed IR mode), make it 2D for consistency.
-        if processed.ndim == 1:
-            processed = processed[np.newaxis, :]
-        for i in range(processed.shape[0]):
-            processed[i, :] = fftconvolve(processed[i, :], freq_resp, mode='same')
+        if signals.ndim == 1:
+            signals = signals[np.newaxis, :]
+        # The convolution returns a new array, so it can be modified in place below.
+        out = _batched_same_convolve(signals, freq_resp,
+                                     spectrum=_frequency_response_spectrum(freq_resp_file, mtime))
+    else:
+        # Nothing to filter: the input is not copied; adding the noise floor allocates the
+        # output unless the input may be overwritten.
+        out = signals
 
     if noise_floor_db is not None:
         noise_std = 10 ** (noise_floor_db / 20.0)
-        processed += noise_std * np.random.randn(*processed.shape)
+        # Draw float32 noise and scale it in place: one half-size buffer, no scaled temporary.
+        noise = _RNG.standard_normal(out.shape, dtype=np.float32)
+        noise *= np.float32(noise_std)
+        if out is signals and not overwrite_input:
+            out = signals + noise
+        else:
+            out += noise
 
-    return processed
+    return out
 
 def write_output(signals, fs, output_file):
     """
@@ -190,10 +491,10 @@ def write_output(signals, fs, output_file):
     output_dir = os.path.dirname(output_file)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
-    # Normalize to avoid clipping.
-    out = signals.T
-    max_val = np.max(np.abs(out))
-    if max_val > 0:
-        out = out / max_val
-    wavfile.write(output_file, fs, np.int16(out * 32767))
+    # Normalize to avoid clipping, quantizing straight into a preallocated int16 buffer.
+    max_val = max(signals.max(), -signals.min())
+    scale = np.float32(32767.0 / max_val) if max_val > 0 else np.float32(32767.0)
+    out = np.empty(signals.T.shape, dtype=np.int16)
+    np.multiply(signals.T, scale, out=out, casting='unsafe')
+    wavfile.write(output_file, fs, out)
     print(f"Output written to {output_file}")